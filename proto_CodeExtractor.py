@@ -1,14 +1,24 @@
 import os
 import re
+import uuid
+import asyncio
 
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, AsyncGraphDatabase
 neo4j_uri = os.environ.get('NEO4J_URI')
 neo4j_user = os.environ.get('NEO4J_USER')
 neo4j_pass = os.environ.get('NEO4J_PASS')
 if (not neo4j_uri or not neo4j_user or not neo4j_pass):
     print("Missing neo4j env variables")
     exit()
-conn = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user,neo4j_pass))
+
+# Async ingestion - keeps several write transactions in flight to hide round-trip latency
+neo4j_async = os.environ.get('NEO4J_ASYNC', '').lower() in ("1", "true", "yes")
+neo4j_inflight = int(os.environ.get('NEO4J_INFLIGHT', 8))
+neo4j_queue = int(os.environ.get('NEO4J_QUEUE', neo4j_inflight * 4))
+
+# The async writer opens its own driver
+if not neo4j_async:
+    conn = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user,neo4j_pass))
 
 # Base folder with repository folders inside
 base_path = "C:\\Repositories"
@@ -28,6 +38,11 @@ php_start = re.compile('<?php')
 open_brace = re.compile('{')
 close_brace = re.compile('}')
 
+# PHP Regex
+basic_namespace_php = re.compile('namespace\\s+(\\w+);')
+basic_class_php = re.compile('class\\s+(\\w+)\\s+{')
+basic_fn_php = re.compile('function\\s+(\\w+)')
+
 
 
 # # File Extraction
@@ -240,7 +255,7 @@ def insert_ClassFunction(name, extension, full_path, short_path, repo, namespace
         addfunction += add_Namespace(namespace)
 
     addfunction += f'''
-    MERGE (c:Class {{name: $className, source: $concatPath}})
+    MERGE (c:Class {{name: $className, source: $concatPath, repository: $repo}})
     ON CREATE SET
         c.version = 1,
         c.added = datetime(),
@@ -250,7 +265,7 @@ def insert_ClassFunction(name, extension, full_path, short_path, repo, namespace
         c.modified = datetime(),
         c.content = $classContent
 
-    MERGE (f:Function {{name: $functionName}})
+    MERGE (f:Function {{name: $functionName, source: $concatPath, repository: $repo}})
     ON CREATE SET
         f.version = 1,
         f.added = datetime(),
@@ -319,7 +334,7 @@ def insert_ClassOnly (name, extension, full_path, short_path, repo, namespace, c
         addfunction += add_Namespace(namespace)
 
     addfunction += f'''
-    MERGE (c:Class {{name: $className, source: $concatPath}})
+    MERGE (c:Class {{name: $className, source: $concatPath, repository: $repo}})
     ON CREATE SET
         c.version = 1,
         c.added = datetime(),
@@ -354,6 +369,352 @@ def insert_ClassOnly (name, extension, full_path, short_path, repo, namespace, c
     exit()
 
 
+# Neo4j Async
+# Write transactions are queued and run by a fixed number of workers. Each write returns a future
+# that resolves once its transaction commits, a child is only queued once its parents' futures have
+# resolved so Documents are committed before their Classes and Functions and workers never sit on a
+# slot waiting. The number of outstanding writes is bounded so the parsers block when the database
+# falls behind.
+class AsyncNeo4jWriter:
+    def __init__ (self, neo4jURI: str, neo4jUSER: str, neo4jPASS: str, inflight: int, queuesize: int):
+        self.uri = neo4jURI
+        self.auth = (neo4jUSER, neo4jPASS)
+        self.inflight = max(1, inflight)
+        self.queuesize = max(self.inflight, queuesize)
+        self.failed = 0
+        self.skipped = 0
+
+    async def __aenter__(self):
+        self.driver = AsyncGraphDatabase.driver(self.uri, auth=self.auth)
+        try:
+            await self.driver.verify_connectivity()
+
+            # Every session shares one bookmark manager so a child always reads its parent's commit,
+            # even after a leader or routing change on a cluster
+            self.bookmarks = AsyncGraphDatabase.bookmark_manager()
+
+            # Without these MERGE isn't atomic, concurrent writes could create the same node twice
+            async with self.driver.session(bookmark_manager=self.bookmarks) as session:
+                for constraint in async_Constraints():
+                    result = await session.run(constraint)
+                    await result.consume()
+        except Exception as e:
+            print(f"Failed to connect: {e}")
+            await self.driver.close()
+            raise
+
+        self.queue = asyncio.Queue()
+        self.pending = asyncio.Semaphore(self.queuesize)
+        self.waiting = set()
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.inflight)]
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # Let every waiting child reach the queue before stopping the workers
+        while self.waiting:
+            await asyncio.gather(*list(self.waiting))
+        await self.queue.join()
+
+        for _ in self.workers:
+            await self.queue.put(None)
+        await asyncio.gather(*self.workers)
+        await self.driver.close()
+
+    # Blocks while too many writes are outstanding
+    # label names the node in log messages, expected is the number of parent rows the query must return as matched
+    async def submit(self, label, query, parameters, after=(), expected=1):
+        await self.pending.acquire()
+        committed = asyncio.get_running_loop().create_future()
+        job = (label, query, parameters, expected, committed)
+        if after:
+            task = asyncio.create_task(self.release(job, after))
+            self.waiting.add(task)
+            task.add_done_callback(self.waiting.discard)
+        else:
+            self.queue.put_nowait(job)
+        return committed
+
+    # Queue a child once its parents have committed, drop it if any of them failed
+    async def release(self, job, after):
+        parents = await asyncio.gather(*after)
+        if all(parents):
+            self.queue.put_nowait(job)
+            return
+
+        label, query, parameters, expected, committed = job
+        self.skipped += 1
+        print(f"Skipped write, parent was not committed: {label}")
+        committed.set_result(False)
+        self.pending.release()
+
+    async def worker(self):
+        while True:
+            job = await self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            label, query, parameters, expected, committed = job
+            try:
+                # execute_write retries transient errors, ingestId keeps the version increments idempotent
+                async with self.driver.session(bookmark_manager=self.bookmarks) as session:
+                    await session.execute_write(self.write, query, parameters, expected)
+                committed.set_result(True)
+            except Exception as e:
+                self.failed += 1
+                print(f"Write failed for {label}: {e}")
+                committed.set_result(False)
+            finally:
+                self.pending.release()
+                self.queue.task_done()
+
+    # A MATCH that finds no parent commits nothing, raise so the transaction rolls back and is counted
+    @staticmethod
+    async def write(tx, query, parameters, expected):
+        result = await tx.run(query, parameters)
+        record = await result.single()
+        if record is None or record["matched"] < expected:
+            raise RuntimeError("Parent node not matched")
+
+# Neo4j Async Queries
+def async_Constraints():
+    return [
+        "CREATE CONSTRAINT repository_name IF NOT EXISTS FOR (r:Repository) REQUIRE r.name IS UNIQUE",
+        "CREATE CONSTRAINT namespace_name IF NOT EXISTS FOR (n:Namespace) REQUIRE n.name IS UNIQUE",
+        "CREATE CONSTRAINT document_key IF NOT EXISTS FOR (d:Document) REQUIRE (d.name, d.type, d.path, d.repository) IS UNIQUE",
+        "DROP CONSTRAINT class_key IF EXISTS",
+        "DROP CONSTRAINT function_key IF EXISTS",
+        "CREATE CONSTRAINT class_repository_key IF NOT EXISTS FOR (c:Class) REQUIRE (c.name, c.source, c.repository) IS UNIQUE",
+        "CREATE CONSTRAINT function_repository_key IF NOT EXISTS FOR (f:Function) REQUIRE (f.name, f.source, f.repository) IS UNIQUE"
+    ]
+
+# A node's version is only incremented once per ingestId, so a retried or replayed transaction
+# does not bump it twice.
+def async_Version(node):
+    return f'''
+        {node}.version = CASE WHEN {node}.ingest = $ingestId THEN {node}.version ELSE COALESCE({node}.version, 1) + 1 END,
+        {node}.ingest = $ingestId,'''
+
+def async_Repository():
+    return '''
+    MERGE (r:Repository {name: $repo})
+    ON CREATE SET
+        r.added = datetime()
+    ON MATCH SET
+        r.modified = datetime()
+    RETURN count(r) AS matched'''
+
+def async_Namespace():
+    return '''
+    MERGE (n:Namespace {name: $namespace})
+    ON CREATE SET
+        n.added = datetime()
+    RETURN count(n) AS matched'''
+
+def async_Document(namespace):
+    adddocument = '''
+    MATCH (r:Repository {name: $repo})'''
+
+    if namespace is not None:
+        adddocument += '''
+    MATCH (n:Namespace {name: $namespace})'''
+
+    adddocument += f'''
+    MERGE (d:Document {{name: $fileName, type: $extension, path: $fullPath, repository: $repo}})
+    ON CREATE SET
+        d.version = 1,
+        d.ingest = $ingestId,
+        d.added = datetime()
+    ON MATCH SET{async_Version("d")}
+        d.modified = datetime()
+
+    MERGE (r)-[:CONTAINS]->(d)'''
+
+    if namespace is not None:
+        adddocument += '''
+    MERGE (d)-[:NAMESPACE]->(n)'''
+
+    adddocument += '''
+    RETURN count(d) AS matched'''
+
+    return adddocument
+
+def async_Class(namespace):
+    addclass = '''
+    MATCH (d:Document {name: $fileName, type: $extension, path: $fullPath, repository: $repo})'''
+
+    if namespace is not None:
+        addclass += '''
+    MATCH (n:Namespace {name: $namespace})'''
+
+    addclass += f'''
+    MERGE (c:Class {{name: $className, source: $concatPath, repository: $repo}})
+    ON CREATE SET
+        c.version = 1,
+        c.ingest = $ingestId,
+        c.added = datetime(),
+        c.content = $classContent
+    ON MATCH SET{async_Version("c")}
+        c.modified = datetime(),
+        c.content = $classContent
+
+    MERGE (d)-[:CLASS]->(c)'''
+
+    if namespace is not None:
+        addclass += '''
+    MERGE (n)-[:NAMESPACECLASS]->(c)'''
+
+    addclass += '''
+    RETURN count(c) AS matched'''
+
+    return addclass
+
+# Functions are keyed by source and repository like Classes, so files sharing a function name don't share a node
+def async_Function(namespace, class_names):
+    addfunction = '''
+    MATCH (d:Document {name: $fileName, type: $extension, path: $fullPath, repository: $repo})'''
+
+    if namespace is not None:
+        addfunction += '''
+    MATCH (n:Namespace {name: $namespace})'''
+
+    addfunction += f'''
+    MERGE (f:Function {{name: $functionName, source: $concatPath, repository: $repo}})
+    ON CREATE SET
+        f.version = 1,
+        f.ingest = $ingestId,
+        f.added = datetime(),
+        f.content = $functionContent,
+        f.linebegin = $linestart,
+        f.lineend = $lineend
+    ON MATCH SET{async_Version("f")}
+        f.modified = datetime(),
+        f.content = $functionContent,
+        f.linebegin = $linestart,
+        f.lineend = $lineend
+
+    MERGE (d)-[:FUNCTION]->(f)'''
+
+    if namespace is not None:
+        addfunction += '''
+    MERGE (n)-[:NAMESPACEFUNCTION]->(f)'''
+
+    # A method name can appear in several classes of the same file, link it to each
+    if class_names:
+        addfunction += '''
+    WITH f
+    MATCH (c:Class {source: $concatPath, repository: $repo}) WHERE c.name IN $classNames
+    MERGE (c)-[:CLASSFUNCTION]->(f)
+    RETURN count(c) AS matched'''
+    else:
+        addfunction += '''
+    RETURN count(f) AS matched'''
+
+    return addfunction
+
+# Parse each file and queue its writes, Repository/Namespace -> Document -> Class -> Function
+async def ingest_async(repositoryFiles):
+    global count_classes, count_functions
+
+    ingest_id = str(uuid.uuid4())
+    print(f"Async ingestion: {neo4j_inflight} transactions in flight, queue size {neo4j_queue}, ingest {ingest_id}")
+
+    # Shared nodes are written once so concurrent Documents don't race to create them
+    committedRepos = {}
+    committedNamespaces = {}
+
+    async with AsyncNeo4jWriter(neo4j_uri, neo4j_user, neo4j_pass, neo4j_inflight, neo4j_queue) as writer:
+        for repositoryFile in repositoryFiles:
+
+            repo_name = repositoryFile[0]
+            full_path = repositoryFile[1]
+            short_path = repositoryFile[2]
+            file_name = repositoryFile[3]
+
+            name, extension = os.path.splitext(file_name)
+            if (extension != ".php"):
+                print(f"Extension not supported: {extension}")
+                continue
+
+            # Parse off the event loop so in-flight transactions keep moving
+            count_classes = [0]
+            count_functions = [0]
+            codeOpen, namespace, codeClasses, codeWithinClass, codeFunctions, codeWithinFunction = await asyncio.to_thread(extractCodeByLine, repositoryFile, basic_namespace_php, basic_class_php, basic_fn_php)
+
+            if (len(codeClasses) != count_classes[0]):
+                print(f"Error: A class was missed. Skipping {full_path}")
+                continue
+            if (len(codeFunctions) != count_functions[0]):
+                print(f"Error: A function was missed. Skipping {full_path}")
+                continue
+
+            parameter = {
+                "ingestId": ingest_id,
+                "fileName": name,
+                "extension": extension,
+                "repo": repo_name,
+                "shortPath": short_path,
+                "fullPath": full_path,
+                "concatPath": short_path + name + extension,
+                "namespace": namespace
+            }
+
+            parents = []
+            if repo_name not in committedRepos:
+                committedRepos[repo_name] = await writer.submit(f"Repository {repo_name}", async_Repository(), parameter)
+            parents.append(committedRepos[repo_name])
+            if namespace is not None:
+                if namespace not in committedNamespaces:
+                    committedNamespaces[namespace] = await writer.submit(f"Namespace {namespace}", async_Namespace(), parameter)
+                parents.append(committedNamespaces[namespace])
+
+            document = await writer.submit(f"Document {full_path}", async_Document(namespace), parameter, parents)
+
+            # One write per (name, source, repository) so a file never MERGEs the same node twice in parallel
+            classRanges = {}
+            for class_name, class_start, class_end in codeClasses:
+                classRanges.setdefault(class_name, []).append((class_start, class_end))
+
+            classes = {}
+            for class_name in classRanges:
+                classes[class_name] = await writer.submit(f"Class {class_name} in {full_path}", async_Class(namespace), {
+                    **parameter,
+                    "className": class_name,
+                    "classContent": codeWithinClass[class_name]
+                }, (document,))
+
+            # codeWithinFunction only holds the last occurrence of a name, so its lines are kept
+            functions = {}
+            for function_name, _, class_name, function_start, function_end in codeFunctions:
+                if function_name not in functions:
+                    functions[function_name] = {"classNames": []}
+                functions[function_name]["linestart"] = function_start
+                functions[function_name]["lineend"] = function_end
+
+                # Only link the class if the function sits inside it
+                if class_name in classRanges and class_name not in functions[function_name]["classNames"]:
+                    if any(class_start <= function_start <= class_end for class_start, class_end in classRanges[class_name]):
+                        functions[function_name]["classNames"].append(class_name)
+
+            for function_name, function in functions.items():
+                class_names = function["classNames"]
+                await writer.submit(f"Function {function_name} in {full_path}", async_Function(namespace, class_names), {
+                    **parameter,
+                    "classNames": class_names,
+                    "functionName": function_name,
+                    "functionContent": codeWithinFunction[function_name],
+                    "linestart": function["linestart"],
+                    "lineend": function["lineend"]
+                }, [classes[class_name] for class_name in class_names] or [document], max(1, len(class_names)))
+
+            print(f"Queued: {full_path} | Classes: {len(classes)}, Functions: {len(functions)}")
+
+    print(f"Async ingestion finished, failed writes: {writer.failed}, skipped writes: {writer.skipped}")
+
+if neo4j_async:
+    asyncio.run(ingest_async(repositoryFiles))
+    exit()
+
+
 # Iterate through all files in the repoository
 for repositoryFile in repositoryFiles:
 
@@ -375,11 +736,6 @@ for repositoryFile in repositoryFiles:
     if (extension == ".php"):
         print(f"Identified PHP script")
 
-        # PHP Regex
-        basic_namespace_php = re.compile('namespace\\s+(\\w+);')
-        basic_class_php = re.compile('class\\s+(\\w+)\\s+{')
-        basic_fn_php = re.compile('function\\s+(\\w+)')
-
         codeOpen, namespace, codeClasses, codeWithinClass, codeFunctions, codeWithinFunction = extractCodeByLine(repositoryFile, basic_namespace_php, basic_class_php, basic_fn_php)
         
         print(f"Total Functions: {count_functions[0]}")